@@ -0,0 +1,305 @@
+# admission_control.py
+import asyncio
+import ipaddress
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from auth.jwt_handler import verify_token
+
+
+# -------------------------------
+# ROUTE CLASSES
+# -------------------------------
+# Matched in order against the request path; anything that doesn't match
+# (root, docs, /metrics) is never limited.
+ROUTE_CLASSES = [
+    ("/predict_", "prediction"),
+    ("/auth/", "auth"),
+    ("/coach", "coach"),
+    ("/patients", "crud"),
+    ("/heart_patients", "crud"),
+]
+
+
+@dataclass
+class RouteClassLimits:
+    concurrency: int      # requests executing at once
+    max_queue: int        # requests allowed to wait for a slot
+    max_wait_ms: float    # longest a request may wait before it is shed
+    rate: float           # per-user tokens refilled per second (0 = unlimited)
+    burst: float          # per-user bucket size
+
+
+DEFAULT_LIMITS = {
+    "prediction": RouteClassLimits(concurrency=8, max_queue=16, max_wait_ms=250, rate=20, burst=40),
+    "crud": RouteClassLimits(concurrency=16, max_queue=32, max_wait_ms=500, rate=20, burst=40),
+    "auth": RouteClassLimits(concurrency=4, max_queue=8, max_wait_ms=1000, rate=1, burst=5),
+    "coach": RouteClassLimits(concurrency=4, max_queue=4, max_wait_ms=2000, rate=0.5, burst=3),
+}
+
+
+def limits_from_env(route_class: str, default: RouteClassLimits) -> RouteClassLimits:
+    """Read ADMISSION_<CLASS>_<SETTING> overrides, e.g. ADMISSION_PREDICTION_CONCURRENCY=4"""
+    prefix = f"ADMISSION_{route_class.upper()}_"
+    limits = RouteClassLimits(
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", default.concurrency)),
+        max_queue=int(os.getenv(prefix + "QUEUE", default.max_queue)),
+        max_wait_ms=float(os.getenv(prefix + "MAX_WAIT_MS", default.max_wait_ms)),
+        rate=float(os.getenv(prefix + "RATE", default.rate)),
+        burst=float(os.getenv(prefix + "BURST", default.burst)),
+    )
+
+    # Fail at startup rather than dividing by zero or never granting a token later
+    if limits.concurrency < 1:
+        raise ValueError(f"{prefix}CONCURRENCY must be at least 1, got {limits.concurrency}")
+    if limits.max_queue < 0:
+        raise ValueError(f"{prefix}QUEUE must not be negative, got {limits.max_queue}")
+    if limits.max_wait_ms <= 0:
+        raise ValueError(f"{prefix}MAX_WAIT_MS must be positive, got {limits.max_wait_ms}")
+    if limits.rate < 0:
+        raise ValueError(f"{prefix}RATE must not be negative (0 disables it), got {limits.rate}")
+    if limits.rate > 0 and limits.burst < 1:
+        raise ValueError(f"{prefix}BURST must be at least 1 when RATE is set, got {limits.burst}")
+    return limits
+
+
+def classify_path(path: str) -> Optional[str]:
+    for prefix, route_class in ROUTE_CLASSES:
+        if path.startswith(prefix):
+            return route_class
+    return None
+
+
+# -------------------------------
+# PER-USER TOKEN BUCKET
+# -------------------------------
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take one token. Returns 0 if allowed, else seconds until one is available."""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+# -------------------------------
+# PER-CLASS CONCURRENCY GATE
+# -------------------------------
+class RouteClassGate:
+    def __init__(self, name: str, limits: RouteClassLimits):
+        self.name = name
+        self.limits = limits
+        self.semaphore = asyncio.Semaphore(limits.concurrency)
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.ewma_latency = 0.0  # seconds, smoothed service time
+        self.counters = {
+            "admitted": 0,
+            "shed_rate_limited": 0,
+            "shed_queue_full": 0,
+            "shed_latency": 0,
+            "shed_timeout": 0,
+        }
+
+    def estimated_wait(self) -> float:
+        """Rough time until a newly queued request would get a slot."""
+        return self.ewma_latency * (self.queue_depth + 1) / self.limits.concurrency
+
+    def record_latency(self, elapsed: float):
+        if self.ewma_latency == 0.0:
+            self.ewma_latency = elapsed
+        else:
+            self.ewma_latency = 0.8 * self.ewma_latency + 0.2 * elapsed
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "concurrency_limit": self.limits.concurrency,
+            "queue_limit": self.limits.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 2),
+            **self.counters,
+        }
+
+
+def parse_trusted_proxies(value: str) -> List[Union[ipaddress.IPv4Network, ipaddress.IPv6Network]]:
+    """Parse ADMISSION_TRUSTED_PROXIES, e.g. "10.0.0.0/8,127.0.0.1" or "*" for any peer"""
+    if value.strip() == "*":
+        return [ipaddress.ip_network("0.0.0.0/0"), ipaddress.ip_network("::/0")]
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in value.split(",") if part.strip()]
+
+
+class AdmissionController:
+    MAX_BUCKETS = 10_000
+
+    def __init__(self, limits: Optional[Dict[str, RouteClassLimits]] = None, enabled: Optional[bool] = None,
+                 trusted_proxies: Optional[str] = None):
+        if limits is None:
+            limits = {name: limits_from_env(name, default) for name, default in DEFAULT_LIMITS.items()}
+        if enabled is None:
+            enabled = os.getenv("ADMISSION_ENABLED", "1") not in ("0", "false", "False")
+        if trusted_proxies is None:
+            trusted_proxies = os.getenv("ADMISSION_TRUSTED_PROXIES", "")
+
+        self.enabled = enabled
+        self.trusted_proxies = parse_trusted_proxies(trusted_proxies)
+        self.gates = {name: RouteClassGate(name, class_limits) for name, class_limits in limits.items()}
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+
+    def is_trusted_proxy(self, host: str) -> bool:
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def client_ip(self, headers: Headers, client) -> str:
+        """
+        Peer address, or the forwarded client address when the peer is a
+        trusted proxy. X-Forwarded-For is read right to left and the first hop
+        that isn't a trusted proxy wins, so clients can't spoof their way into
+        someone else's bucket by prepending addresses.
+        """
+        peer = client[0] if client else "unknown"
+        forwarded = headers.get("X-Forwarded-For")
+        if not forwarded or not self.is_trusted_proxy(peer):
+            return peer
+
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if not self.is_trusted_proxy(hop):
+                return hop
+        return hops[0] if hops else peer
+
+    def user_key(self, headers: Headers, client) -> str:
+        """Key rate limits off the authenticated user, falling back to client IP."""
+        token = headers.get("Authorization")
+        if token:
+            payload = verify_token(token.replace("Bearer ", ""))
+            if payload and "user_id" in payload:
+                return f"user:{payload['user_id']}"
+        return f"ip:{self.client_ip(headers, client)}"
+
+    def check_rate(self, route_class: str, user_key: str) -> float:
+        limits = self.gates[route_class].limits
+        if limits.rate <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        key = (route_class, user_key)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_BUCKETS:
+                self.prune(now)
+            bucket = self.buckets[key] = TokenBucket(limits.rate, limits.burst, now)
+        return bucket.take(now)
+
+    def prune(self, now: float):
+        """Drop buckets that have refilled completely; they carry no state."""
+        for key, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[key]
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "tracked_users": len(self.buckets),
+            "route_classes": {name: gate.snapshot() for name, gate in self.gates.items()},
+        }
+
+
+admission_controller = AdmissionController()
+
+
+# -------------------------------
+# ASGI MIDDLEWARE
+# -------------------------------
+class AdmissionControlMiddleware:
+    """
+    Sheds load before it reaches the threadpool.
+    429 when a user exceeds their token bucket, 503 when the route class
+    is saturated (queue full, expected wait too long, or wait timed out).
+    """
+
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.controller.enabled or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        route_class = classify_path(scope["path"])
+        gate = self.controller.gates.get(route_class)
+        if gate is None:
+            return await self.app(scope, receive, send)
+
+        # 1️⃣ Per-user rate limit
+        user_key = self.controller.user_key(Headers(scope=scope), scope.get("client"))
+        retry_after = self.controller.check_rate(route_class, user_key)
+        if retry_after:
+            gate.counters["shed_rate_limited"] += 1
+            return await self.reject(scope, receive, send, 429, "Rate limit exceeded", retry_after)
+
+        if not gate.semaphore.locked():
+            # 2️⃣ Fast path: a slot is free, acquire() returns without yielding
+            await gate.semaphore.acquire()
+        else:
+            # 3️⃣ Shed early when there is no point in queueing
+            if gate.queue_depth >= gate.limits.max_queue:
+                gate.counters["shed_queue_full"] += 1
+                return await self.reject(scope, receive, send, 503, "Server busy, try again shortly")
+            if gate.estimated_wait() * 1000 > gate.limits.max_wait_ms:
+                gate.counters["shed_latency"] += 1
+                return await self.reject(scope, receive, send, 503, "Server busy, try again shortly")
+
+            # 4️⃣ Wait for a slot, bounded by max_wait_ms
+            gate.queue_depth += 1
+            gate.max_queue_depth = max(gate.max_queue_depth, gate.queue_depth)
+            try:
+                await asyncio.wait_for(gate.semaphore.acquire(), gate.limits.max_wait_ms / 1000)
+            except asyncio.TimeoutError:
+                gate.counters["shed_timeout"] += 1
+                return await self.reject(scope, receive, send, 503, "Server busy, try again shortly")
+            finally:
+                gate.queue_depth -= 1
+
+        gate.counters["admitted"] += 1
+        gate.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.record_latency(time.perf_counter() - start)
+            gate.in_flight -= 1
+            gate.semaphore.release()
+
+    async def reject(self, scope, receive, send, status_code: int, detail: str, retry_after: float = 1.0):
+        response = JSONResponse(
+            {"detail": detail},
+            status_code=status_code,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        await response(scope, receive, send)
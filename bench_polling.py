@@ -0,0 +1,146 @@
+# bench_polling.py
+"""
+Bandwidth and server CPU for a frontend polling GET /patients/.
+
+Runs the app in-process against a throwaway SQLite database, seeds it, then
+polls the list route the way the frontend does, with a write every
+--change-every polls. Each scenario reports bytes on the wire per poll
+(status line + response headers + encoded body, so a 304 is not free) and
+process CPU per poll. Headers a real server adds (Date, Server) aren't
+counted, which slightly flatters every scenario equally. CPU includes the
+in-process test client, which costs roughly the same in every scenario, so
+compare scenarios against each other rather than reading the numbers as
+absolute server cost.
+
+    python bench_polling.py --patients 100 --polls 500 --change-every 50
+"""
+import argparse
+import os
+import tempfile
+import time
+
+# Benchmark traffic would otherwise be rate limited as a single client
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import http_cache
+import models
+from database import get_db
+from main import app
+
+
+def seed(SessionTest, n: int):
+    with SessionTest() as db:
+        for i in range(n):
+            db.add(models.Patient(
+                Age=30 + i % 50, Gender="Female" if i % 2 else "Male", Smoking_History="Never",
+                BMI=24.5, FEV1=3.1, FVC=4.0, PEF=420.0, Oxygen_Saturation=97.0,
+                Respiratory_Rate=16, Heart_Rate=72, Wheezing=i % 2, Cough=0,
+                Shortness_of_Breath=0, Chest_Tightness=0, Allergen_Exposure=1,
+                Air_Pollution_Level=40.0, Family_History_Asthma=0, FEV1_FVC_Ratio=0.78,
+                Hospital_Visits=i % 3, Asthma_Diagnosis=0,
+            ))
+        db.commit()
+        http_cache.ensure_versions(db)
+
+
+def touch(SessionTest, step: int):
+    """Simulate another client editing a patient"""
+    with SessionTest() as db:
+        db.query(models.Patient).filter(models.Patient.id == 1).update({models.Patient.Hospital_Visits: step})
+        http_cache.bump_version(db, "patients")
+        db.commit()
+
+
+def response_wire_bytes(response) -> int:
+    """Status line + headers + body as sent over HTTP/1.1 (body still encoded)"""
+    status_line = f"HTTP/1.1 {response.status_code} {response.reason_phrase}\r\n"
+    header_bytes = sum(len(name) + len(value) + 4 for name, value in response.headers.raw)  # "name: value\r\n"
+    return len(status_line) + header_bytes + 2 + response.num_bytes_downloaded
+
+
+def run(client, SessionTest, polls: int, change_every: int, accept_encoding: str, conditional: bool):
+    etag = None
+    wire_bytes = 0
+    not_modified = 0
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for step in range(polls):
+        if change_every and step and step % change_every == 0:
+            touch(SessionTest, step)
+
+        headers = {"Accept-Encoding": accept_encoding}
+        if conditional and etag:
+            headers["If-None-Match"] = etag
+
+        response = client.get("/patients/", headers=headers)
+        wire_bytes += response_wire_bytes(response)
+        if response.status_code == 304:
+            not_modified += 1
+        else:
+            etag = response.headers.get("etag")
+
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    return {
+        "bytes_per_poll": wire_bytes / polls,
+        "cpu_ms_per_poll": cpu * 1000 / polls,
+        "wall_ms_per_poll": wall * 1000 / polls,
+        "not_modified": not_modified,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark polling GET /patients/")
+    parser.add_argument("--patients", type=int, default=100)
+    parser.add_argument("--polls", type=int, default=500)
+    parser.add_argument("--change-every", type=int, default=50, help="write between polls every N polls (0 = never)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+        SessionTest = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        models.Base.metadata.create_all(bind=engine)
+        seed(SessionTest, args.patients)
+
+        def get_test_db():
+            db = SessionTest()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = get_test_db
+
+        scenarios = [
+            ("full, identity", "identity", False),
+            ("full, gzip", "gzip", False),
+            ("full, br", "br, gzip", False),
+            ("conditional, identity", "identity", True),
+            ("conditional, br/gzip", "br, gzip", True),
+        ]
+        if http_cache.brotli is None:
+            print("brotli not installed: 'br' scenarios fall back to gzip")
+
+        print(f"{args.patients} patients, {args.polls} polls, write every {args.change_every} polls")
+        print("bytes/poll = status line + response headers + encoded body")
+        print(f"{'scenario':<24}{'bytes/poll':>12}{'cpu ms/poll':>13}{'wall ms/poll':>14}{'304s':>7}")
+        with TestClient(app) as client:
+            for name, accept_encoding, conditional in scenarios:
+                client.get("/patients/")  # warm up
+                result = run(client, SessionTest, args.polls, args.change_every, accept_encoding, conditional)
+                print(
+                    f"{name:<24}{result['bytes_per_poll']:>12.0f}{result['cpu_ms_per_poll']:>13.3f}"
+                    f"{result['wall_ms_per_poll']:>14.3f}{result['not_modified']:>7}"
+                )
+
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,19 @@
 import joblib
 import pandas as pd
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+from tree_explainer import TreeContributionExplainer
 
 class HeartPredictionService:
+    # Raw input columns, before the model's ColumnTransformer
+    FEATURE_NAMES = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg',
+                     'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+
     def __init__(self, model_path: str = "heart_prediction_rf[1].pkl"): # <-- Load your 85% model
         self.model_path = Path(model_path)
         self.model = None
+        self.explainer = None
         self.load_model()
 
     def load_model(self):
@@ -16,11 +23,21 @@ class HeartPredictionService:
             if self.model_path.exists():
                 self.model = joblib.load(self.model_path)
                 print(f"✅ Heart disease model loaded successfully from {self.model_path}")
+                self.load_explainer()
             else:
                 print(f"⚠️ Model file not found at {self.model_path}")
         except Exception as e:
             print(f"❌ Error loading heart model: {e}")
 
+    def load_explainer(self):
+        """Precompute per-node contribution deltas for explain=true"""
+        try:
+            # One-hot columns are folded back into their source field (e.g. cp_2 -> cp)
+            self.explainer = TreeContributionExplainer(self.model, self.FEATURE_NAMES)
+        except Exception as e:
+            self.explainer = None
+            print(f"⚠️ Explanations unavailable for heart model: {e}")
+
     # --- NO MANUAL PREPROCESSING IS NEEDED ---
     # Your model file 'heart_prediction_rf[1].pkl' already has
     # the ColumnTransformer, StandardScaler, and OneHotEncoder
@@ -75,5 +92,26 @@ class HeartPredictionService:
         except Exception as e:
             return {"error": str(e), "prediction": None, "confidence": 0.0}
 
+    def predict_batch(self, patients: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Predict many patients with a single vectorized model call"""
+        if self.model is None:
+            return {"error": "Model not loaded", "predictions": None}
+
+        try:
+            df = pd.DataFrame(patients)
+            return {"predictions": [int(p) for p in self.model.predict(df)], "error": None}
+        except Exception as e:
+            return {"error": str(e), "predictions": None}
+
+    def explain(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-field contributions to the heart disease probability"""
+        if self.explainer is None:
+            return {"error": "Explanations not available for this model"}
+
+        try:
+            return self.explainer.explain(pd.DataFrame(patient_data, index=[0]))
+        except Exception as e:
+            return {"error": str(e)}
+
 # Create a single instance for your app to import
 heart_prediction_service = HeartPredictionService()
\ No newline at end of file
@@ -0,0 +1,226 @@
+# http_cache.py
+"""
+Conditional GET and response compression for patient resources.
+
+Every write to `patients` / `heart_patients` bumps a per-table version row in
+the same transaction. GET handlers look up that single row first; when the
+client's If-None-Match / If-Modified-Since still matches they answer 304
+without running the list query or serializing anything.
+"""
+import gzip
+import os
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers, MutableHeaders
+
+import models
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+VERSIONED_TABLES = ("patients", "heart_patients")
+
+
+# -------------------------------
+# TABLE VERSIONS
+# -------------------------------
+def ensure_versions(db: Session, tables: Iterable[str] = VERSIONED_TABLES):
+    """Create missing version rows so bump_version can be a plain UPDATE"""
+    # INSERT OR IGNORE: every uvicorn worker runs this at import, possibly at once
+    now = datetime.utcnow().replace(microsecond=0)
+    stmt = sqlite_insert(models.TableVersion).values(
+        [{"table_name": table, "version": 0, "updated_at": now} for table in tables]
+    ).on_conflict_do_nothing(index_elements=["table_name"])
+    db.execute(stmt)
+    db.commit()
+
+
+def bump_version(db: Session, table: str):
+    """Invalidate cached representations of `table`. Call before db.commit()"""
+    row = models.TableVersion.table_name == table
+
+    # Increment first: the UPDATE takes the write lock, so the read-modify-write
+    # of updated_at below can't interleave with another writer's bump
+    db.query(models.TableVersion).filter(row).update(
+        {models.TableVersion.version: models.TableVersion.version + 1},
+        synchronize_session=False,
+    )
+
+    # Last-Modified has one-second resolution, so every bump must move it by at
+    # least a whole second or two writes in the same second would share a date
+    previous = db.query(models.TableVersion.updated_at).filter(row).scalar()
+    updated_at = datetime.utcnow().replace(microsecond=0)
+    if previous is not None:
+        updated_at = max(updated_at, previous.replace(microsecond=0) + timedelta(seconds=1))
+
+    db.query(models.TableVersion).filter(row).update(
+        {models.TableVersion.updated_at: updated_at},
+        synchronize_session=False,
+    )
+
+
+def get_version(db: Session, table: str) -> Optional[models.TableVersion]:
+    return db.query(models.TableVersion).filter(models.TableVersion.table_name == table).first()
+
+
+# -------------------------------
+# CONDITIONAL GET
+# -------------------------------
+def make_etag(version: models.TableVersion) -> str:
+    # Weak: the same version may be sent gzip'd, brotli'd or identity
+    return f'W/"{version.table_name}-{version.version}"'
+
+
+def last_modified(version: models.TableVersion) -> datetime:
+    # HTTP dates have one-second resolution
+    return version.updated_at.replace(microsecond=0)
+
+
+def is_not_modified(request: Request, version: Optional[models.TableVersion]) -> bool:
+    if version is None:
+        return False
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+        if if_none_match.strip() == "*":
+            return True
+        etag = make_etag(version)
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison: ignore W/ prefixes on either side
+        return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        # Safe at one-second resolution because bump_version always advances
+        # updated_at by at least a whole second
+        return last_modified(version) <= since
+
+    return False
+
+
+def cache_headers(version: Optional[models.TableVersion]) -> dict:
+    if version is None:
+        return {}
+    return {
+        "ETag": make_etag(version),
+        "Last-Modified": format_datetime(last_modified(version).replace(tzinfo=timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",  # always revalidate; 304s make that cheap
+    }
+
+
+def set_cache_headers(response: Response, version: Optional[models.TableVersion]):
+    response.headers.update(cache_headers(version))
+
+
+def not_modified(version: models.TableVersion) -> Response:
+    return Response(status_code=304, headers=cache_headers(version))
+
+
+# -------------------------------
+# RESPONSE COMPRESSION
+# -------------------------------
+def accepted_encodings(accept_encoding: str) -> dict:
+    """Parse Accept-Encoding into {coding: q}"""
+    encodings = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[coding.strip().lower()] = q
+    return encodings
+
+
+class CompressionMiddleware:
+    """
+    Compresses single-chunk JSON/text responses above `minimum_size` with
+    brotli (when installed and accepted) or gzip. Streaming responses and
+    anything already encoded pass through untouched.
+    """
+
+    COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+    def __init__(self, app, minimum_size: Optional[int] = None, gzip_level: Optional[int] = None,
+                 brotli_quality: Optional[int] = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+        self.gzip_level = gzip_level if gzip_level is not None else int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+        self.brotli_quality = brotli_quality if brotli_quality is not None else int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+
+    def choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        accepted = accepted_encodings(accept_encoding)
+        if brotli is not None and accepted.get("br", 0) > 0:
+            return "br"
+        if accepted.get("gzip", accepted.get("*", 0)) > 0:
+            return "gzip"
+        return None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if (message["status"] != 200 or "content-encoding" in headers
+                        or not content_type.startswith(self.COMPRESSIBLE_TYPES)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Hold the start message until we've seen the body
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            body = message.get("body", b"")
+
+            if message.get("more_body", False) or encoding is None or len(body) < self.minimum_size:
+                # Streaming, not negotiated, or too small to be worth it
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = self.compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
 import database
 Base = database.Base
 
@@ -63,4 +63,13 @@ class HeartPatient(Base):
     thal = Column(Integer)
     
     # This is your prediction column, based on main.py
-    Heart_Disease_Diagnosis = Column(Integer) # 0 = No, 1 = Yes
\ No newline at end of file
+    Heart_Disease_Diagnosis = Column(Integer) # 0 = No, 1 = Yes
+
+
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+
+    # One row per cached table; bumped by every write (see http_cache.py)
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
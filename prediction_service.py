@@ -1,14 +1,24 @@
 import numpy as np
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List
 import joblib
 from sklearn.preprocessing import LabelEncoder
 
+from tree_explainer import TreeContributionExplainer
+
 class PredictionService:
+    # Feature order expected by the trained model
+    NUMERIC_FIELDS = ['Age', 'BMI', 'FEV1', 'FVC', 'PEF', 'Oxygen_Saturation', 'Hospital_Visits']
+    BINARY_FIELDS = ['Wheezing', 'Cough', 'Shortness_of_Breath', 'Chest_Tightness', 'Allergen_Exposure', 'Family_History_Asthma']
+    REMAINING_NUMERIC_FIELDS = ['Respiratory_Rate', 'Heart_Rate', 'FEV1_FVC_Ratio', 'Air_Pollution_Level']
+    CATEGORICAL_FIELDS = ['Gender', 'Smoking_History']
+    FEATURE_NAMES = NUMERIC_FIELDS + BINARY_FIELDS + REMAINING_NUMERIC_FIELDS + CATEGORICAL_FIELDS
+
     def __init__(self, model_path: str = f"asthma_prediction_rf[1].pkl"):
         self.model = None
         self.model_path = Path(model_path)
         self.label_encoders = {}
+        self.explainer = None
         self.feature_count = 19  # total features expected by the trained model
         self.load_model()
      
@@ -18,13 +28,30 @@ class PredictionService:
             if self.model_path.exists():
                 self.model = joblib.load(self.model_path)
                 print(f"Model loaded successfully from {self.model_path}")
+                self.load_explainer()
             else:
                 print(f"Model file not found at {self.model_path}")
         except Exception as e:
             print(f"Error loading model: {e}")
+
+    def load_explainer(self):
+        """Precompute per-node contribution deltas for explain=true"""
+        try:
+            self.explainer = TreeContributionExplainer(self.model, self.FEATURE_NAMES)
+        except Exception as e:
+            self.explainer = None
+            print(f"Explanations unavailable for asthma model: {e}")
     
     def preprocess_data(self, patient_data: Dict[str, Any]) -> np.ndarray:
         """Preprocess patient data for prediction"""
+        return np.array(self.feature_row(patient_data)).reshape(1, -1)
+
+    def preprocess_batch(self, patients: List[Dict[str, Any]]) -> np.ndarray:
+        """Preprocess many patients into one (n, feature_count) matrix"""
+        return np.array([self.feature_row(p) for p in patients]).reshape(len(patients), self.feature_count)
+
+    def feature_row(self, patient_data: Dict[str, Any]) -> List[Any]:
+        """Build the model's feature vector for a single patient"""
         # Categorical fields
         categorical_mappings = {
             'Gender': ['Male', 'Female', 'Other'],
@@ -41,18 +68,15 @@ class PredictionService:
         features = []
 
         # 1️⃣ Numeric fields in model order
-        numeric_fields = ['Age', 'BMI', 'FEV1', 'FVC', 'PEF', 'Oxygen_Saturation', 'Hospital_Visits']
-        for field in numeric_fields:
+        for field in self.NUMERIC_FIELDS:
             features.append(patient_data.get(field, 0))
 
         # 2️⃣ Binary fields (frontend sends 0/1)
-        binary_fields = ['Wheezing', 'Cough', 'Shortness_of_Breath', 'Chest_Tightness', 'Allergen_Exposure', 'Family_History_Asthma']
-        for field in binary_fields:
+        for field in self.BINARY_FIELDS:
             features.append(patient_data.get(field, 0))
 
         # 3️⃣ Remaining numeric fields
-        remaining_numeric = ['Respiratory_Rate', 'Heart_Rate', 'FEV1_FVC_Ratio', 'Air_Pollution_Level']
-        for field in remaining_numeric:
+        for field in self.REMAINING_NUMERIC_FIELDS:
             features.append(patient_data.get(field, 0))
 
         # 4️⃣ Categorical fields
@@ -67,7 +91,7 @@ class PredictionService:
         if len(features) != self.feature_count:
             raise ValueError(f"Feature mismatch: {len(features)} features, expected {self.feature_count}")
 
-        return np.array(features).reshape(1, -1)
+        return features
     
     def predict(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
         """Make prediction for a patient"""
@@ -112,4 +136,25 @@ class PredictionService:
         except Exception as e:
             return {"error": f"Prediction failed: {str(e)}", "prediction": None, "confidence": 0.0}
 
+    def predict_batch(self, patients: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Predict many patients with a single vectorized model call"""
+        if self.model is None:
+            return {"error": "Model not loaded", "predictions": None}
+
+        try:
+            X = self.preprocess_batch(patients)
+            return {"predictions": [int(p) for p in self.model.predict(X)], "error": None}
+        except Exception as e:
+            return {"error": f"Batch prediction failed: {str(e)}", "predictions": None}
+
+    def explain(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-field contributions to the asthma probability"""
+        if self.explainer is None:
+            return {"error": "Explanations not available for this model"}
+
+        try:
+            return self.explainer.explain(self.preprocess_data(patient_data))
+        except Exception as e:
+            return {"error": f"Explanation failed: {str(e)}"}
+
 prediction_service = PredictionService()
@@ -0,0 +1,249 @@
+# rescore.py
+"""
+Re-score stored patients after a model change.
+
+Streams `patients` and `heart_patients` in id-ordered chunks, predicts each
+chunk with one model call and writes changed diagnoses back in bulk.
+A row is only written if its features and diagnosis are unchanged since it
+was read, so a concurrent PUT is never overwritten with a stale diagnosis.
+Rows the model can't score are skipped and their ids recorded in the
+checkpoint, so one bad row never stops the job. Progress is checkpointed
+after every chunk, so a crashed run resumes where it stopped. A duty cycle
+throttles the job to leave room for live traffic.
+
+    python rescore.py                       # both tables, resume if possible
+    python rescore.py --table patients --chunk-size 1000 --duty-cycle 0.25
+    python rescore.py --restart             # ignore the checkpoint
+"""
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from sqlalchemy import and_, bindparam
+
+import database
+import http_cache
+import models
+from prediction_service import prediction_service as asthma_service
+from heart_prediction_service import heart_prediction_service
+
+DEFAULT_CHECKPOINT = database.BASE_DIR / "rescore_checkpoint.json"
+
+# table name -> (ORM model, prediction service, diagnosis column)
+TABLES = {
+    "patients": (models.Patient, asthma_service, "Asthma_Diagnosis"),
+    "heart_patients": (models.HeartPatient, heart_prediction_service, "Heart_Disease_Diagnosis"),
+}
+
+
+# -------------------------------
+# CHECKPOINT
+# -------------------------------
+def model_fingerprint(service) -> Dict[str, Any]:
+    """Identify the loaded model file so progress from an older model isn't reused"""
+    path = Path(service.model_path)
+    if not path.exists():
+        return {"path": str(path)}
+    stat = path.stat()
+    return {"path": str(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: Path, checkpoint: Dict[str, Any]):
+    """Write atomically so a crash never leaves a half-written checkpoint"""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+# -------------------------------
+# RE-SCORING
+# -------------------------------
+def score_chunk(table: str, service, patients, ids):
+    """
+    Score a chunk with one batch call. If the batch fails, fall back to one
+    row at a time so a single unscorable row (NULL feature, unseen category)
+    can't stall the job. Returns {id: prediction} and the skipped ids.
+    """
+    result = service.predict_batch(patients)
+    if not result.get("error"):
+        return dict(zip(ids, result["predictions"])), []
+
+    print(f"[{table}] batch failed ({result['error']}), scoring ids {ids[0]}-{ids[-1]} one by one")
+    predictions, skipped = {}, []
+    for row_id, patient in zip(ids, patients):
+        row_result = service.predict_batch([patient])
+        if row_result.get("error"):
+            print(f"[{table}] skipping id {row_id}: {row_result['error']}")
+            skipped.append(row_id)
+        else:
+            predictions[row_id] = row_result["predictions"][0]
+    return predictions, skipped
+
+
+def conditional_update(model, diagnosis_column: str, feature_columns):
+    """
+    UPDATE ... SET diagnosis = :new WHERE id = :old_id AND <every feature and
+    the diagnosis still hold the values we scored>. Rows edited since the
+    chunk was read match nothing and keep the diagnosis their PUT computed.
+    """
+    table = model.__table__
+    checked = [*feature_columns, table.c[diagnosis_column]]
+    return (
+        table.update()
+        .where(and_(
+            table.c.id == bindparam("old_id"),
+            # IS, not =, so NULL features still compare equal
+            *[c.is_not_distinct_from(bindparam(f"old_{c.name}")) for c in checked],
+        ))
+        .values({diagnosis_column: bindparam("new_diagnosis")})
+    )
+
+
+def rescore_table(table: str, checkpoint: Dict[str, Any], checkpoint_path: Path,
+                  chunk_size: int, duty_cycle: float):
+    model, service, diagnosis_column = TABLES[table]
+    if service.model is None:
+        print(f"[{table}] model not loaded, skipping")
+        return
+
+    fingerprint = model_fingerprint(service)
+    state = checkpoint.get(table)
+    if state and state.get("model") != fingerprint:
+        print(f"[{table}] checkpoint was written for a different model, starting over")
+        state = None
+    if state is None:
+        state = {"model": fingerprint, "last_id": 0, "rows": 0, "changed": 0, "conflicts": 0,
+                 "skipped_ids": [], "done": False}
+        checkpoint[table] = state
+    state.setdefault("skipped_ids", [])
+    state.setdefault("conflicts", 0)
+    if state["done"]:
+        print(f"[{table}] already re-scored with this model, nothing to do")
+        return
+
+    feature_columns = [
+        c for c in model.__table__.columns
+        if c.name not in ("id", "user_id", diagnosis_column)
+    ]
+    id_column = model.__table__.c.id
+    diagnosis = model.__table__.c[diagnosis_column]
+
+    update_stmt = conditional_update(model, diagnosis_column, feature_columns)
+    checked_columns = [*feature_columns, diagnosis]
+
+    db = database.SessionLocal()
+    try:
+        remaining = db.query(model).filter(model.id > state["last_id"]).count()
+        print(f"[{table}] resuming after id {state['last_id']}, {remaining} rows to score")
+
+        started = time.perf_counter()
+        scored = 0
+        while True:
+            chunk_started = time.perf_counter()
+
+            # Keyset pagination: stable and O(chunk) regardless of how far in we are
+            rows = (
+                db.query(id_column, diagnosis, *feature_columns)
+                .filter(id_column > state["last_id"])
+                .order_by(id_column)
+                .limit(chunk_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            patients = [{c.name: getattr(row, c.name) for c in feature_columns} for row in rows]
+            predictions, skipped = score_chunk(table, service, patients, [row.id for row in rows])
+
+            updates = [
+                {
+                    "old_id": row.id,
+                    "new_diagnosis": predictions[row.id],
+                    **{f"old_{c.name}": getattr(row, c.name) for c in checked_columns},
+                }
+                for row in rows
+                if row.id in predictions and getattr(row, diagnosis_column) != predictions[row.id]
+            ]
+            written = 0
+            if updates:
+                written = db.execute(update_stmt, updates).rowcount
+                if written:
+                    http_cache.bump_version(db, table)
+            db.commit()
+            # Rows edited by a live request since we read them were left alone
+            conflicts = len(updates) - written
+
+            # Commit first, checkpoint second: a crash in between only repeats this chunk
+            state["last_id"] = rows[-1].id
+            state["rows"] += len(rows)
+            state["changed"] += written
+            state["conflicts"] += conflicts
+            state["skipped_ids"].extend(skipped)
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            scored += len(rows)
+            elapsed = time.perf_counter() - started
+            rate = scored / elapsed if elapsed else 0.0
+            left = max(remaining - scored, 0)
+            eta = left / rate if rate else 0.0
+            print(
+                f"[{table}] {scored}/{remaining} rows | {rate:.0f} rows/s | "
+                f"ETA {eta:.1f}s | changed {written} in chunk, {state['changed']} total | "
+                f"skipped {len(state['skipped_ids'])} | edited concurrently {state['conflicts']}"
+            )
+
+            # Throttle: work for duty_cycle of the wall time, sleep for the rest
+            busy = time.perf_counter() - chunk_started
+            if duty_cycle < 1:
+                time.sleep(busy * (1 - duty_cycle) / duty_cycle)
+
+        state["done"] = True
+        save_checkpoint(checkpoint_path, checkpoint)
+        print(f"[{table}] done: {state['rows']} rows scored, {state['changed']} diagnoses changed, "
+              f"{len(state['skipped_ids'])} skipped, {state['conflicts']} left to concurrent edits")
+        if state["skipped_ids"]:
+            print(f"[{table}] skipped ids (see {checkpoint_path}): {state['skipped_ids'][:20]}"
+                  f"{' ...' if len(state['skipped_ids']) > 20 else ''}")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored patients with the currently loaded models")
+    parser.add_argument("--table", choices=[*TABLES, "all"], default="all")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--duty-cycle", type=float, default=0.5,
+                        help="fraction of wall time spent working (0-1], the rest is spent sleeping")
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    if not 0 < args.duty_cycle <= 1:
+        parser.error("--duty-cycle must be in (0, 1]")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be positive")
+
+    # Make sure the ETag version rows exist even if the API has never started
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as db:
+        http_cache.ensure_versions(db)
+
+    checkpoint = {} if args.restart else load_checkpoint(args.checkpoint)
+    tables = list(TABLES) if args.table == "all" else [args.table]
+    for table in tables:
+        rescore_table(table, checkpoint, args.checkpoint, args.chunk_size, args.duty_cycle)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, Optional
 
 class UserCreate(BaseModel):
     name: str
@@ -71,12 +71,20 @@ class Patient(PatientBase):
 class PredictionRequest(PatientBase):
     pass
 
+class FeatureExplanation(BaseModel):
+    base_value: float                 # mean root-node probability of the forest (after resampling)
+    probability: float                # model's positive-class probability == base_value + sum(contributions)
+    contributions: Dict[str, float]   # per input field
+    latency_ms: float
+
+
 class PredictionResponse(BaseModel):
     prediction: int
     confidence: float
     prediction_text: str
     risk_level: str
     error: Optional[str] = None
+    explanation: Optional[FeatureExplanation] = None
 
 
 # -------------------------------
@@ -120,4 +128,5 @@ class HeartPredictionResponse(BaseModel):
     prediction_text: str
     risk_level: str
     error: Optional[str] = None
+    explanation: Optional[FeatureExplanation] = None
     
\ No newline at end of file
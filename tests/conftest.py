@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The repo root is a flat set of modules (main.py, models.py, ...), and its
+# __init__.py would otherwise make pytest import tests as a nested package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
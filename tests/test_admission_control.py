@@ -0,0 +1,45 @@
+from starlette.datastructures import Headers
+
+from admission_control import AdmissionController, RouteClassLimits
+
+
+def make_controller(trusted_proxies=""):
+    limits = {"auth": RouteClassLimits(concurrency=4, max_queue=8, max_wait_ms=1000, rate=1, burst=1)}
+    return AdmissionController(limits=limits, enabled=True, trusted_proxies=trusted_proxies)
+
+
+def take(controller, headers, client):
+    key = controller.user_key(Headers(headers), client)
+    return controller.check_rate("auth", key)
+
+
+def test_different_clients_do_not_share_a_bucket():
+    controller = make_controller()
+
+    assert take(controller, {}, ("203.0.113.1", 5000)) == 0
+    assert take(controller, {}, ("203.0.113.2", 5000)) == 0
+    # Same client again is over its burst of 1
+    assert take(controller, {}, ("203.0.113.1", 5001)) > 0
+
+
+def test_forwarded_clients_behind_trusted_proxy_get_their_own_buckets():
+    controller = make_controller(trusted_proxies="10.0.0.0/8")
+    proxy = ("10.0.0.5", 443)
+
+    assert take(controller, {"X-Forwarded-For": "198.51.100.7"}, proxy) == 0
+    assert take(controller, {"X-Forwarded-For": "198.51.100.8"}, proxy) == 0
+    assert take(controller, {"X-Forwarded-For": "198.51.100.7"}, proxy) > 0
+
+
+def test_forwarded_header_ignored_from_untrusted_peer():
+    controller = make_controller()
+    headers = {"X-Forwarded-For": "198.51.100.7"}
+
+    assert controller.user_key(Headers(headers), ("203.0.113.1", 5000)) == "ip:203.0.113.1"
+
+
+def test_spoofed_forwarded_prefix_does_not_change_bucket():
+    controller = make_controller(trusted_proxies="10.0.0.0/8")
+    headers = {"X-Forwarded-For": "1.2.3.4, 198.51.100.7"}
+
+    assert controller.user_key(Headers(headers), ("10.0.0.5", 443)) == "ip:198.51.100.7"
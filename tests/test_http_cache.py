@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+import http_cache
+import models
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    http_cache.ensure_versions(session)
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def request_with(headers):
+    raw = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/patients/", "headers": raw})
+
+
+def bump(db, table="patients"):
+    http_cache.bump_version(db, table)
+    db.commit()
+
+
+def test_echoed_last_modified_is_not_modified(db):
+    bump(db)
+    version = http_cache.get_version(db, "patients")
+    last_modified = http_cache.cache_headers(version)["Last-Modified"]
+
+    request = request_with({"If-Modified-Since": last_modified})
+    assert http_cache.is_not_modified(request, http_cache.get_version(db, "patients"))
+    assert http_cache.not_modified(version).status_code == 304
+
+
+def test_write_in_same_second_invalidates_last_modified(db):
+    bump(db)
+    last_modified = http_cache.cache_headers(http_cache.get_version(db, "patients"))["Last-Modified"]
+
+    # Immediately after: almost certainly the same wall-clock second
+    bump(db)
+    version = http_cache.get_version(db, "patients")
+
+    assert http_cache.cache_headers(version)["Last-Modified"] != last_modified
+    assert not http_cache.is_not_modified(request_with({"If-Modified-Since": last_modified}), version)
+
+
+def test_ensure_versions_is_idempotent(db):
+    bump(db)
+    http_cache.ensure_versions(db)
+
+    assert http_cache.get_version(db, "patients").version == 1
+    assert db.query(models.TableVersion).count() == len(http_cache.VERSIONED_TABLES)
@@ -0,0 +1,219 @@
+# tree_explainer.py
+"""
+Per-prediction feature contributions for tree ensembles.
+
+Each step down a decision tree moves the node's positive-class probability
+from the parent's value to the child's. Crediting that delta to the feature
+the parent split on gives contributions that, summed with the root value
+(averaged over trees), reproduce predict_proba exactly:
+
+    probability = base_value + sum(contributions)
+
+base_value is the mean root-node probability of the forest (after
+resampling). Roots are fitted on bootstrap samples and, for the heart
+pipeline, on SMOTE-rebalanced data, so it sits near 0.5 there. It is
+not the real prevalence.
+
+Every explanation checks that identity against the full pipeline's
+predict_proba, so a bad node value or a mis-split pipeline (e.g. the
+SMOTE step in ColumnTransformer -> SMOTE -> RandomForest) surfaces as an
+error instead of a plausible-looking explanation.
+
+The deltas and the field each one belongs to are precomputed once when
+the model loads, so explaining a request is one decision_path call plus a
+bincount - O(trees x depth), no sampling.
+"""
+import threading
+import time
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+
+def split_pipeline(model):
+    """Return (preprocessing steps applied at predict time, final estimator)"""
+    if not hasattr(model, "steps"):
+        return [], model
+
+    steps = []
+    for _, step in model.steps[:-1]:
+        # Skip "passthrough" / None steps and samplers (imblearn's fit_resample only runs at fit time)
+        if step is None or step == "passthrough" or not hasattr(step, "transform"):
+            continue
+        steps.append(step)
+    return steps, model.steps[-1][1]
+
+
+def resolve_columns(columns, current_names: Sequence[str]) -> List[int]:
+    """Turn a ColumnTransformer column spec into positions in the current feature list"""
+    if isinstance(columns, (str, int, np.integer)):
+        columns = [columns]
+    elif isinstance(columns, slice):
+        return list(range(len(current_names)))[columns]
+    elif callable(columns):
+        raise ValueError("callable column selectors are not supported")
+
+    columns = list(columns)
+    if columns and isinstance(columns[0], (bool, np.bool_)):
+        return [i for i, keep in enumerate(columns) if keep]
+    return [current_names.index(c) if isinstance(c, str) else int(c) for c in columns]
+
+
+def column_transformer_fields(transformer, field_of: List[int], current_names: List[str]):
+    """Map each ColumnTransformer output column back to the input field it came from"""
+    new_fields, new_names = [], []
+    for _, trans, columns in transformer.transformers_:
+        if isinstance(trans, str) and trans == "drop":
+            continue
+        positions = resolve_columns(columns, current_names)
+        if not positions:
+            continue
+        source_names = [current_names[p] for p in positions]
+
+        if isinstance(trans, str) and trans == "passthrough":
+            names_out = source_names
+        else:
+            names_out = list(trans.get_feature_names_out(source_names))
+
+        if len(names_out) == len(positions):
+            # Scalers, imputers, ordinal encoders: one column in, one out
+            sources = positions
+        else:
+            # One-hot style expansion: "cp_2" came from "cp" (longest matching prefix wins)
+            sources = []
+            for name in names_out:
+                matches = [p for p in positions
+                           if name == current_names[p] or name.startswith(current_names[p] + "_")]
+                if not matches:
+                    raise ValueError(f"cannot map transformed feature {name!r} back to an input field")
+                sources.append(max(matches, key=lambda p: len(current_names[p])))
+
+        new_fields.extend(field_of[p] for p in sources)
+        new_names.extend(str(n) for n in names_out)
+    return new_fields, new_names
+
+
+class TreeContributionExplainer:
+    def __init__(self, model, input_names: Sequence[str]):
+        self.model = model
+        self.steps, self.estimator = split_pipeline(model)
+        self.input_names = [str(n) for n in getattr(model, "feature_names_in_", input_names)]
+
+        if hasattr(self.estimator, "estimators_"):
+            trees = list(self.estimator.estimators_)
+            self.is_forest = True
+        elif hasattr(self.estimator, "tree_"):
+            trees = [self.estimator]
+            self.is_forest = False
+        else:
+            raise ValueError(f"{type(self.estimator).__name__} is not a tree model")
+        if not all(hasattr(t, "tree_") for t in trees):
+            raise ValueError("ensemble contains non-tree estimators")
+
+        classes = list(self.estimator.classes_)
+        positive = classes.index(1) if 1 in classes else len(classes) - 1
+        self.positive = positive
+
+        field_of = self.transformed_fields(self.estimator.n_features_in_)
+
+        # Precompute, for every node of every tree (in decision_path column order),
+        # the probability delta from its parent and the input field the parent split on
+        deltas, fields, roots = [], [], []
+        for tree in trees:
+            t = tree.tree_
+            value = t.value[:, 0, :]
+            prob = value[:, positive] / value.sum(axis=1)
+
+            delta = np.zeros(t.node_count)
+            field = np.zeros(t.node_count, dtype=np.intp)
+            internal = np.flatnonzero(t.children_left != -1)
+            for children in (t.children_left[internal], t.children_right[internal]):
+                delta[children] = prob[children] - prob[internal]
+                field[children] = field_of[t.feature[internal]]
+
+            deltas.append(delta)
+            fields.append(field)
+            roots.append(prob[0])
+
+        self.n_trees = len(trees)
+        self.node_delta = np.concatenate(deltas) / self.n_trees
+        self.node_field = np.concatenate(fields)
+        # Mean root-node probability of the forest (after resampling), not the training prevalence
+        self.base_value = float(np.mean(roots))
+
+        # Latency stats, surfaced in /metrics; explain() runs on threadpool workers
+        self.stats_lock = threading.Lock()
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def transformed_fields(self, n_features: int) -> np.ndarray:
+        """Input field index for each column the final estimator sees"""
+        field_of = list(range(len(self.input_names)))
+        current_names = list(self.input_names)
+
+        for step in self.steps:
+            if hasattr(step, "transformers_"):
+                field_of, current_names = column_transformer_fields(step, field_of, current_names)
+            elif hasattr(step, "get_feature_names_out"):
+                names_out = list(step.get_feature_names_out(current_names))
+                if len(names_out) != len(current_names):
+                    raise ValueError(f"{type(step).__name__} changes the feature count; cannot attribute")
+                current_names = [str(n) for n in names_out]
+
+        if len(field_of) != n_features:
+            raise ValueError(f"Feature mismatch: mapped {len(field_of)} features, model expects {n_features}")
+        return np.asarray(field_of, dtype=np.intp)
+
+    # Largest allowed gap between base_value + sum(contributions) and predict_proba
+    TOLERANCE = 1e-6
+
+    def explain(self, X) -> Dict[str, Any]:
+        """Contributions for the first row of X (raw model input, before the pipeline)"""
+        start = time.perf_counter()
+
+        Xt = X
+        for step in self.steps:
+            Xt = step.transform(Xt)
+
+        path = self.estimator.decision_path(Xt)
+        indicator = path[0] if self.is_forest else path
+        visited = indicator[0].indices
+
+        contributions = np.bincount(
+            self.node_field[visited],
+            weights=self.node_delta[visited],
+            minlength=len(self.input_names),
+        )
+
+        # Ask the full pipeline, not self.estimator, so a wrong split_pipeline shows up here too
+        probability = float(self.model.predict_proba(X)[0, self.positive])
+        reconstructed = self.base_value + float(contributions.sum())
+        if abs(reconstructed - probability) > self.TOLERANCE:
+            raise ValueError(
+                f"contributions sum to {reconstructed:.6f} but model predicts {probability:.6f}"
+            )
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self.stats_lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+        return {
+            "base_value": self.base_value,
+            "probability": probability,
+            "contributions": {name: float(c) for name, c in zip(self.input_names, contributions)},
+            "latency_ms": elapsed_ms,
+        }
+
+    def stats(self) -> Dict[str, float]:
+        with self.stats_lock:
+            calls, total_ms, max_ms = self.calls, self.total_ms, self.max_ms
+        return {
+            "calls": calls,
+            "avg_ms": round(total_ms / calls, 3) if calls else 0.0,
+            "max_ms": round(max_ms, 3),
+            "trees": self.n_trees,
+            "nodes": int(self.node_delta.size),
+        }